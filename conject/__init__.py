@@ -1,13 +1,13 @@
 import conject.utils
-from conject._container import (
-    Container, AsyncContainer, InstanceError, MissingValue, DependencyCycle, InvalidImplParam,
-    InvalidInstanceType,
-)
+from conject._container import Container, AsyncContainer
 from conject._container_config import (
     RefValue, ListValue, DictValue, ExpressionValue, DeferredValue, ContainerConfig, InstanceConfig,
     check_container_config, defer_value, load_container_config,
 )
 from conject._dep_spec import DepSpec, AsyncDepSpec
+from conject._errors import (
+    InstanceError, MissingValue, DependencyCycle, InvalidImplParam, InvalidInstanceType,
+)
 from conject._impl import Impl, FactoryType
 
 
@@ -1,145 +1,126 @@
 from contextlib import ExitStack
-from typing import Generic, TypeVar, Dict, Any, Callable, Sequence, Mapping, List, Type
+from typing import (
+    Generic, TypeVar, Dict, Any, Callable, Mapping, List, Type, Iterable, Optional, Set,
+)
 
 from async_exit_stack import AsyncExitStack
 
-from conject._impl import Impl, FactoryType
-from conject._utils import run_coro_synchronously, get_factory_params
-from conject._container_config import ContainerConfig, InstanceConfig, DeferredValue
-from conject._types import PreparedSyncImpl, PreparedAsyncImpl, Parameter
+from conject._utils import get_callable_params
+from conject._container_config import (
+    ContainerConfig, DeferredValue, check_container_config, make_plan_steps,
+)
+from conject._errors import MissingValue, InvalidInstanceType
+from conject._plan import Plans, make_instance_ids
+from conject._types import PreparedSyncImpl, PreparedAsyncImpl, Parameter, missing
 from conject._validation import ValidationError, make_validator
 from conject.utils import SkipTypeCheck
 
 TPreparedImpl = TypeVar('TPreparedImpl', PreparedSyncImpl, PreparedAsyncImpl)
 TExitStack = TypeVar('TExitStack', ExitStack, AsyncExitStack)
 TGetType = TypeVar('TGetType')
+TContainer = TypeVar('TContainer', bound='BaseContainer')
 
 
 class BaseContainer(Generic[TPreparedImpl, TExitStack]):
     def __init__(
             self, impls: Dict[str, TPreparedImpl], config: ContainerConfig, exit_stack: TExitStack,
     ):
-        self._impls: Dict[str, TPreparedImpl] = impls
-        self._config = config
+        """
+        :raises ValueError
+        :raises DependencyCycle
+        """
+
+        # Kept for compatibility, dep specs create containers by `_create` to share their plans.
+        check_container_config(config, impls)
+        steps = make_plan_steps(config, impls)
+        instance_ids = make_instance_ids(steps)
+        self._setup(exit_stack, instance_ids, Plans(steps, instance_ids, is_async=self._is_async))
+
+    @classmethod
+    def _create(
+            cls: Type[TContainer], exit_stack: TExitStack, instance_ids: Mapping[str, int],
+            plans: Plans,
+    ) -> TContainer:
+
+        container = cls.__new__(cls)
+        container._setup(exit_stack, instance_ids, plans)
+        return container
+
+    _is_async = False
+
+    def _setup(self, exit_stack: TExitStack, instance_ids: Mapping[str, int], plans: Plans) -> None:
         self._exit_stack: TExitStack = exit_stack
-        self._instances: Dict[str, Any] = {'container': self}  # TODO: refactorme
+        # Everything needed to construct an instance is resolved into its plan step/builder.
+        self._plans: Plans = plans
+        self._instance_ids: Dict[str, int] = dict(instance_ids)
+        self._slots: List[Any] = [self._missing] * len(instance_ids)
+        self._slots[instance_ids['container']] = self  # TODO: refactorme
+        self._building: Set[int] = set()  # ids of instances being built
 
     def inject(self, instances: Dict[str, Any]) -> None:
         for name in instances.keys():
-            if name in self._instances:
+            if self._get_slot(name) is not self._missing:
                 raise ValueError('instance already exists', name)
 
-        self._instances.update(instances)
+        for name, instance in instances.items():
+            inst_id = self._instance_ids.get(name)
+            if inst_id is None:
+                self._instance_ids[name] = len(self._slots)
+                self._slots.append(instance)
+            else:
+                self._slots[inst_id] = instance
 
     def ensure_constructible(self, name: str) -> None:
-        run_coro_synchronously(self._async_get(name, [], dry_run=True))
+        self._ensure_constructible(name, [])
 
-    _missing = object()
-    _initializing = object()
+    _missing = missing
 
-    async def _get_factory_param_vals(self, factory: Callable) -> Mapping[str, Any]:
-        params = get_factory_params(Impl(FactoryType.Func, 'factory', factory))
+    def _get_slot(self, inst_name: str) -> Any:
+        inst_id = self._instance_ids.get(inst_name)
+        return self._missing if inst_id is None else self._slots[inst_id]
 
-        param_vals = {}
-        for param in params.values():
-            param_vals[param.name] = await self._get_param_val([], param)
-
-        return param_vals
+    def _ensure_constructible(self, inst_name: str, stack: List[str]) -> None:
+        stack = stack + [inst_name]
+        inst_id = self._instance_ids.get(inst_name)
+        if inst_id is None:
+            raise MissingValue(stack)
+        if self._slots[inst_id] is not self._missing:
+            return
 
-    async def _get_param_val(
-            self, build_stack: List[str],
-            param: Parameter,
-            configured_value: Any = _missing,
-            dry_run: bool = False,
-    ) -> Any:
+        step = self._plans.get_step(inst_name)
+        if step is None:
+            raise MissingValue(stack)
 
-        if configured_value is self._missing and param.has_default():
-            configured_value = param.default
+        for dep_name in step.deps:
+            self._ensure_constructible(dep_name, stack)
 
-        if configured_value is self._missing:
-            # Parameter is not configured nor have a default.
-            # So lets fetch an instance with the same name.
-            param_val = await self._async_get_raw(param.name, build_stack, dry_run)
+    def _get_plan(self, inst_name: str, inst_id: Optional[int]) -> Callable:
+        plan = None if inst_id is None else self._plans.get(inst_name, inst_id)
+        if plan is None:
+            raise MissingValue([inst_name])
 
-        elif isinstance(configured_value, DeferredValue):
-            resolved_deps = {
-                dep_name: await self._async_get(dep_name, build_stack, dry_run=dry_run)
-                for dep_name in configured_value.deps
-            }
-            param_val = None
-            if not dry_run:
-                # TODO: handle errors
-                param_val = configured_value.eval(resolved_deps)
+        return plan
 
-        else:
-            param_val = configured_value
+    def _get_factory_params(self, factory: Callable) -> Iterable[Parameter]:
+        return get_callable_params(factory)
 
+    def _check_param_val(self, param: Parameter, param_val: Any) -> Any:
         if isinstance(param_val, SkipTypeCheck):
-            param_val = param_val.value
-        elif not dry_run:
-            param_val = param.validator(param_val)
+            return param_val.value
 
-        return param_val
+        return param.validator(param_val)
 
-    async def _async_get(
-            self, inst_name: str, stack: list,
-            *, dry_run: bool = False, check_type: Any = None,
-    ) -> Any:
-
-        instance = await self._async_get_raw(inst_name, stack, dry_run)
+    def _check_instance(self, inst_name: str, instance: Any, check_type: Any) -> Any:
         if isinstance(instance, SkipTypeCheck):
-            instance = instance.value
-        elif check_type is not None:
-            validator = make_validator(check_type, f'inst__{inst_name}')
-            try:
-                instance = validator(instance)
-            except ValidationError as e:
-                raise InvalidInstanceType(inst_name, e.expected_type, e.value) from e
-
-        return instance
-
-    async def _async_get_raw(self, inst_name: str, stack: list, dry_run: bool = False) -> Any:
-        stack = stack + [inst_name]
-
-        instance = self._instances.get(inst_name, self._missing)
-        if instance is self._initializing:
-            raise DependencyCycle(stack)
-        if instance is not self._missing:
+            return instance.value
+        if check_type is None:
             return instance
 
-        self._instances[inst_name] = self._initializing
-
+        validator = make_validator(check_type, f'inst__{inst_name}')
         try:
-            inst_config = self._config.instances.get(inst_name, InstanceConfig(inst_name, {}))
-
-            impl = self._impls.get(inst_config.impl_name)
-            if impl is None:
-                raise MissingValue(stack)
-
-            param_vals = {}
-            for param in impl.params.values():
-                configured_value = inst_config.parameters.get(param.name, self._missing)
-
-                try:
-                    param_vals[param.name] = await self._get_param_val(
-                        stack, param, configured_value, dry_run)
-                except ValidationError as e:
-                    raise InvalidImplParam(inst_name, param.name, e.expected_type, e.value) from e
-
-            instance = None
-            if not dry_run:
-                instance = await self._run_impl(impl, param_vals)
-                self._instances[inst_name] = instance
-            else:
-                del self._instances[inst_name]
-        except BaseException:
-            del self._instances[inst_name]
-            raise
-
-        return instance
-
-    async def _run_impl(self, impl: TPreparedImpl, params: Dict[str, Any]):
-        raise NotImplementedError
+            return validator(instance)
+        except ValidationError as e:
+            raise InvalidInstanceType(inst_name, e.expected_type, e.value) from e
 
 
 class Container(BaseContainer[PreparedSyncImpl, ExitStack]):
@@ -148,96 +129,91 @@ class Container(BaseContainer[PreparedSyncImpl, ExitStack]):
         :raises InstanceError
         """
 
-        coro = self._async_get(name, [], check_type=check_type)
-        return run_coro_synchronously(coro)
+        instance = self._get_raw(name)
+        return self._check_instance(name, instance, check_type)
 
     def get_params(self, factory: Callable) -> Mapping[str, Any]:
         """
         :raises InstanceError
         """
 
-        coro = self._get_factory_param_vals(factory)
-        return run_coro_synchronously(coro)
+        return {
+            param.name: self._get_param_val(param)
+            for param in self._get_factory_params(factory)
+        }
+
+    def _get_param_val(self, param: Parameter) -> Any:
+        if not param.has_default():
+            # Parameter doesn't have a default.
+            # So lets fetch an instance with the same name.
+            param_val = self._get_raw(param.name)
+
+        elif isinstance(param.default, DeferredValue):
+            resolved_deps: Dict[str, Any] = {
+                dep_name: self.get(dep_name)
+                for dep_name in param.default.deps
+            }
+            # TODO: handle errors
+            param_val = param.default.eval(resolved_deps)
+
+        else:
+            param_val = param.default
+
+        return self._check_param_val(param, param_val)
+
+    def _get_raw(self, inst_name: str) -> Any:
+        inst_id = self._instance_ids.get(inst_name)
+        instance = self._missing if inst_id is None else self._slots[inst_id]
+        if instance is self._missing:
+            instance = self._get_plan(inst_name, inst_id)(self, None)
 
-    async def _run_impl(self, impl: PreparedSyncImpl, params: Dict[str, Any]):
-        instance = self._exit_stack.enter_context(impl.ctx_mgr(**params))
         return instance
 
 
 class AsyncContainer(BaseContainer[PreparedAsyncImpl, AsyncExitStack]):
+    _is_async = True
+
     async def get(self, name: str, check_type: Type[TGetType] = None) -> TGetType:
         """
         :raises InstanceError
         """
 
-        return await self._async_get(name, [], check_type=check_type)
+        instance = await self._get_raw(name)
+        return self._check_instance(name, instance, check_type)
 
     async def get_params(self, factory: Callable) -> Mapping[str, Any]:
         """
         :raises InstanceError
         """
 
-        return await self._get_factory_param_vals(factory)
+        return {
+            param.name: await self._get_param_val(param)
+            for param in self._get_factory_params(factory)
+        }
 
-    async def _run_impl(self, impl: PreparedAsyncImpl, params: Dict[str, Any]):
-        instance = await self._exit_stack.enter_async_context(impl.ctx_mgr(**params))
-        return instance
+    async def _get_param_val(self, param: Parameter) -> Any:
+        if not param.has_default():
+            # Parameter doesn't have a default.
+            # So lets fetch an instance with the same name.
+            param_val = await self._get_raw(param.name)
 
+        elif isinstance(param.default, DeferredValue):
+            resolved_deps: Dict[str, Any] = {
+                dep_name: await self.get(dep_name)
+                for dep_name in param.default.deps
+            }
+            # TODO: handle errors
+            param_val = param.default.eval(resolved_deps)
 
-class InstanceError(Exception):
-    pass
+        else:
+            param_val = param.default
 
+        return self._check_param_val(param, param_val)
 
-class MissingValue(InstanceError):
-    def __init__(self, instance_stack: Sequence[str]):
-        assert len(instance_stack)
-        self._instance_stack = instance_stack
+    async def _get_raw(self, inst_name: str) -> Any:
+        inst_id = self._instance_ids.get(inst_name)
+        instance = self._missing if inst_id is None else self._slots[inst_id]
+        if instance is self._missing:
+            instance = await self._get_plan(inst_name, inst_id)(self, None)
 
-    def __str__(self) -> str:
-        if len(self._instance_stack) == 1:
-            instance, = self._instance_stack
-            return f'Neither instance nor impl exists {instance!r}'
-        else:
-            *rest, instance, param = self._instance_stack
-            build_chain = ' -> '.join(repr(item) for item in rest)
-            return (
-                f'Parameter {param!r} of instance {instance!r} is not configured '
-                f'(while building {build_chain} -> {instance!r})'
-            )
-
-
-class DependencyCycle(InstanceError):
-    def __init__(self, instances: Sequence[str]):
-        assert(len(instances))
-        self._instances = instances
-
-    def __str__(self) -> str:
-        build_chain = ' -> '.join(repr(item) for item in self._instances)
-        return f'Instance {self._instances[0]!r} is depending on itself: {build_chain}'
-
-
-class InvalidImplParam(InstanceError):
-    def __init__(self, inst_name: str, param_name: str, expected_type: Type, value: Any):
-        self.inst_name = inst_name
-        self.param_name = param_name
-        self.expected_type = expected_type
-        self.value = value
-
-    def __str__(self) -> str:
-        return (
-            f'Invalid param value for {self.inst_name}.{self.param_name}.'
-            f' Expected of type {self.expected_type}, got {self.value!r}'
-        )
-
-
-class InvalidInstanceType(InstanceError):
-    def __init__(self, inst_name: str, expected_type: Type, value: Any):
-        self.inst_name = inst_name
-        self.expected_type = expected_type
-        self.value = value
-
-    def __str__(self) -> str:
-        return (
-            f'Invalid {self.inst_name!r} type.'
-            f' Expected of type {self.expected_type}, got {self.value!r}'
-        )
+        return instance
@@ -1,8 +1,18 @@
-from types import SimpleNamespace
-from typing import NamedTuple, Any, Dict, Union, Set, cast
-
+import functools
+import sys
+from types import MappingProxyType, SimpleNamespace
+from typing import (
+    NamedTuple, Any, Dict, Union, Set, Tuple, List, Iterable, Optional, FrozenSet, AbstractSet,
+    Mapping,
+)
+
+from conject._errors import DependencyCycle
 from conject._expressions import expr_dependencies
-from conject._types import PreparedSyncImpl, PreparedAsyncImpl
+from conject._validation import is_empty_validator
+from conject.utils import SkipTypeCheck
+from conject._types import (
+    PreparedSyncImpl, PreparedAsyncImpl, ParamKind, ParamSite, PlanStep, missing,
+)
 
 _impl_keyword = '-impl'
 _ref_keyword = '-ref'
@@ -12,16 +22,16 @@ ref_holder_name = 'refs'
 
 class InstanceConfig(NamedTuple):
     impl_name: str
-    parameters: Dict[str, Any]
+    parameters: Mapping[str, Any]
 
 
 class ContainerConfig(NamedTuple):
-    instances: Dict[str, InstanceConfig]
+    instances: Mapping[str, InstanceConfig]
 
 
 class DeferredValue:
     @property
-    def deps(self) -> Set[str]:
+    def deps(self) -> AbstractSet[str]:
         raise NotImplementedError
 
     def eval(self, deps: Dict[str, Any]) -> Any:
@@ -31,71 +41,90 @@ class DeferredValue:
 class ExpressionValue(DeferredValue):
     def __init__(self, code: str):
         self._code = code
-        self._deps = expr_dependencies(self._code, ref_holder_name)
+        self._code_obj = compile(code, '<config>', 'eval')
+        self._deps = _parse_expr_deps(code, ref_holder_name)
 
     @property
-    def deps(self) -> Set[str]:
+    def deps(self) -> FrozenSet[str]:
         return self._deps
 
     def eval(self, deps: Dict[str, Any]) -> Any:
-        expr_globals = {
-            ref_holder_name: SimpleNamespace(**deps),
-        }
+        # Fresh globals for every evaluation, since the value may be shared between threads.
+        expr_globals = {ref_holder_name: SimpleNamespace(**deps)}
         # TODO: handle errors
-        return eval(self._code, expr_globals, expr_globals)
+        return eval(self._code_obj, expr_globals, expr_globals)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_expr_deps(code: str, holder_name: str) -> FrozenSet[str]:
+    return frozenset(expr_dependencies(code, holder_name))
 
 
 class DictValue(DeferredValue):
     def __init__(self, conf_dict: dict):
-        self._conf_dict = conf_dict
-        # TODO: cycles?
-        self._deps = cast(Set[str], set()).union(*(
-            value.deps
-            for value in self._conf_dict.values()
+        # Deferred values are replaced in a copy of template, so keys order is preserved.
+        self._template = {
+            key: (None if isinstance(value, DeferredValue) else value)
+            for key, value in conf_dict.items()
+        }
+        self._deferred: List[Tuple[Any, DeferredValue]] = [
+            (key, value)
+            for key, value in conf_dict.items()
             if isinstance(value, DeferredValue)
+        ]
+        self._deps: FrozenSet[str] = frozenset().union(*(
+            value.deps
+            for _, value in self._deferred
         ))
 
     @property
-    def deps(self) -> Set[str]:
+    def deps(self) -> FrozenSet[str]:
         return self._deps
 
     def eval(self, deps: Dict[str, Any]) -> Any:
-        # TODO: cycles?
-        return {
-            key: (value.eval(deps) if isinstance(value, DeferredValue) else value)
-            for key, value in self._conf_dict.items()
-        }
+        result = self._template.copy()
+        for key, value in self._deferred:
+            result[key] = value.eval(deps)
+
+        return result
 
 
 class ListValue(DeferredValue):
     def __init__(self, conf_list: list):
-        self._conf_list = conf_list
-        # TODO: cycles?
-        self._deps = cast(Set[str], set()).union(*(
-            item.deps
-            for item in self._conf_list
+        self._template = [
+            None if isinstance(item, DeferredValue) else item
+            for item in conf_list
+        ]
+        self._deferred: List[Tuple[int, DeferredValue]] = [
+            (idx, item)
+            for idx, item in enumerate(conf_list)
             if isinstance(item, DeferredValue)
+        ]
+        self._deps: FrozenSet[str] = frozenset().union(*(
+            item.deps
+            for _, item in self._deferred
         ))
 
     @property
-    def deps(self) -> Set[str]:
+    def deps(self) -> FrozenSet[str]:
         return self._deps
 
     def eval(self, deps: Dict[str, Any]) -> Any:
-        # TODO: cycles?
-        return [
-            item.eval(deps) if isinstance(item, DeferredValue) else item
-            for item in self._conf_list
-        ]
+        result = self._template.copy()
+        for idx, item in self._deferred:
+            result[idx] = item.eval(deps)
+
+        return result
 
 
 class RefValue(DeferredValue):
     def __init__(self, name: str):
         self._name = name
+        self._deps = frozenset((name,))
 
     @property
-    def deps(self) -> Set[str]:
-        return {self._name}
+    def deps(self) -> FrozenSet[str]:
+        return self._deps
 
     def eval(self, deps: Dict[str, Any]) -> Any:
         return deps[self._name]
@@ -105,11 +134,12 @@ def load_container_config(value: Any) -> ContainerConfig:
     if not isinstance(value, dict):
         raise TypeError('container config should be dict', type(value))
 
+    # Loaded config is read-only.
     result = ContainerConfig(
-        instances={
-            inst_name: _load_instance_config(inst_name, inst_conf)
+        instances=MappingProxyType({
+            _intern_key(inst_name): _load_instance_config(inst_name, inst_conf)
             for inst_name, inst_conf in value.items()
-        },
+        }),
     )
 
     return result
@@ -119,6 +149,23 @@ def check_container_config(
         config: ContainerConfig,
         impls: Union[Dict[str, PreparedSyncImpl], Dict[str, PreparedAsyncImpl]],
 ) -> None:
+    """
+    :raises ValueError
+    :raises DependencyCycle
+    """
+
+    check_instance_impls(config, impls)
+    # Cycles of not configured impls are only reported once such instance is requested.
+    check_dependency_cycles(make_plan_steps(config, impls), config.instances)
+
+
+def check_instance_impls(
+        config: ContainerConfig,
+        impls: Union[Dict[str, PreparedSyncImpl], Dict[str, PreparedAsyncImpl]],
+) -> None:
+    """
+    :raises ValueError
+    """
 
     for name, instance_config in config.instances.items():
         impl = impls.get(instance_config.impl_name)
@@ -126,12 +173,200 @@ def check_container_config(
             raise ValueError('impl doesn\'t exist', name, instance_config.impl_name)
 
         for param_name, param_value in instance_config.parameters.items():
-            if param_name not in impl.params:
+            if param_name not in impl.param_names:
                 raise ValueError(
                     'impl doesn\'t have specified param',
                     instance_config.impl_name, param_name)
 
 
+def check_dependency_cycles(
+        steps: Mapping[str, PlanStep], roots: Optional[Iterable[str]] = None,
+) -> None:
+    """
+    Check that instances don't depend on themselves.
+
+    :param roots: Look only for cycles reachable from these instances.
+    :raises DependencyCycle
+    """
+
+    cycle = _find_dependency_cycle(steps, steps if roots is None else roots)
+    if cycle is not None:
+        raise DependencyCycle(cycle)
+
+
+def make_plan_steps(
+        config: ContainerConfig,
+        impls: Union[Dict[str, PreparedSyncImpl], Dict[str, PreparedAsyncImpl]],
+) -> Dict[str, PlanStep]:
+    """
+    Describe construction of every instance that could be built using given impls and config.
+
+    Config is expected to be checked by `check_instance_impls`.
+    """
+
+    steps = make_impl_steps(impls)
+    steps.update(make_config_steps(config, impls))
+    return steps
+
+
+def make_impl_steps(
+        impls: Union[Dict[str, PreparedSyncImpl], Dict[str, PreparedAsyncImpl]],
+) -> Dict[str, PlanStep]:
+    """Describe construction of instances named after impls, as if they are not configured."""
+
+    return {
+        inst_name: _make_plan_step(inst_name, impl, {})
+        for inst_name, impl in impls.items()
+        if inst_name != 'container'
+    }
+
+
+def make_config_steps(
+        config: ContainerConfig,
+        impls: Union[Dict[str, PreparedSyncImpl], Dict[str, PreparedAsyncImpl]],
+) -> Dict[str, PlanStep]:
+    """Describe construction of configured instances, they take precedence over impl steps."""
+
+    return {
+        inst_name: _make_plan_step(
+            inst_name, impls[inst_config.impl_name], inst_config.parameters,
+        )
+        for inst_name, inst_config in config.instances.items()
+        if inst_name != 'container'
+    }
+
+
+def _make_plan_step(
+        inst_name: str, impl: Union[PreparedSyncImpl, PreparedAsyncImpl],
+        parameters: Mapping[str, Any],
+) -> PlanStep:
+
+    sites = get_param_sites(impl, parameters)
+    return PlanStep(inst_name, impl, sites, get_sites_deps(sites))
+
+
+def get_param_sites(
+        impl: Union[PreparedSyncImpl, PreparedAsyncImpl], parameters: Mapping[str, Any],
+) -> Tuple[ParamSite, ...]:
+    """Classify the source of every impl param value."""
+
+    sites = []
+    for param in impl.params:
+        value = parameters.get(param.name, missing)
+        if value is missing and param.has_default():
+            value = param.default
+
+        validate = not is_empty_validator(param.validator)
+        if value is missing:
+            # Parameter is not configured nor have a default.
+            # So lets fetch an instance with the same name.
+            site = ParamSite(param, ParamKind.Instance, param.name, validate)
+        elif isinstance(value, RefValue):
+            dep_name, = value.deps
+            site = ParamSite(param, ParamKind.Ref, dep_name, validate)
+        elif isinstance(value, DeferredValue):
+            site = ParamSite(param, ParamKind.Deferred, value, validate)
+        elif isinstance(value, SkipTypeCheck):
+            site = ParamSite(param, ParamKind.Literal, value.value, False)
+        else:
+            site = ParamSite(param, ParamKind.Literal, value, validate)
+
+        sites.append(site)
+
+    return tuple(sites)
+
+
+def get_sites_deps(sites: Tuple[ParamSite, ...]) -> Tuple[str, ...]:
+    """Get names of instances required to construct impl params, in order of fetching."""
+
+    deps: Dict[str, None] = {}  # used as ordered set
+    for site in sites:
+        if site.kind in (ParamKind.Instance, ParamKind.Ref):
+            deps[site.payload] = None
+        elif site.kind == ParamKind.Deferred:
+            deps.update(dict.fromkeys(site.payload.deps))
+
+    return tuple(deps)
+
+
+def _find_dependency_cycle(
+        steps: Mapping[str, PlanStep], roots: Iterable[str],
+) -> Optional[List[str]]:
+    # Iterative Tarjan's algorithm, stops on the first non-trivial strongly connected component.
+
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    scc_stack: List[str] = []
+    on_stack: Set[str] = set()
+
+    for root in roots:
+        if root in index or root not in steps:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        scc_stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(steps[root].deps))]
+
+        while work:
+            node, deps = work[-1]
+            for dep in deps:
+                if dep not in steps:
+                    continue
+
+                if dep not in index:
+                    index[dep] = lowlink[dep] = len(index)
+                    scc_stack.append(dep)
+                    on_stack.add(dep)
+                    work.append((dep, iter(steps[dep].deps)))
+                    break
+
+                if dep in on_stack:
+                    lowlink[node] = min(lowlink[node], index[dep])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                if lowlink[node] != index[node]:
+                    continue
+
+                component = set()
+                while True:
+                    member = scc_stack.pop()
+                    on_stack.discard(member)
+                    component.add(member)
+                    if member == node:
+                        break
+
+                if len(component) > 1 or node in steps[node].deps:
+                    return _find_cycle_path(node, steps, component)
+
+    return None
+
+
+def _find_cycle_path(
+        start: str, steps: Mapping[str, PlanStep], component: Set[str],
+) -> List[str]:
+
+    parents: Dict[str, str] = {}
+    queue = [start]
+    for node in queue:
+        for dep in steps[node].deps:
+            if dep == start:
+                path = [node]
+                while path[-1] != start:
+                    path.append(parents[path[-1]])
+                return path[::-1] + [start]
+
+            if dep in component and dep not in parents:
+                parents[dep] = node
+                queue.append(dep)
+
+    raise AssertionError('strongly connected component without cycle')
+
+
 def defer_value(config: Any) -> Any:
     return _load_param_value(config)
 
@@ -142,11 +377,20 @@ def _load_instance_config(instance_name: str, params_value: Any) -> InstanceConf
 
     params_value = params_value.copy()
     impl_name = params_value.pop(_impl_keyword, instance_name)
+    if not isinstance(impl_name, str):
+        raise TypeError(f'{_impl_keyword} should be str', instance_name)
+
+    impl_name = sys.intern(impl_name)
     parameters = {
-        param_name: _load_param_value(param_value)
+        _intern_key(param_name): _load_param_value(param_value)
         for param_name, param_value in params_value.items()
     }
-    return InstanceConfig(impl_name=impl_name, parameters=parameters)
+    return InstanceConfig(impl_name=impl_name, parameters=MappingProxyType(parameters))
+
+
+def _intern_key(key: Any) -> Any:
+    # Keys are not validated yet, invalid ones are reported by `check_instance_impls`.
+    return sys.intern(key) if isinstance(key, str) else key
 
 
 _sentinel = object()
@@ -170,7 +414,7 @@ def _load_param_value(value: Any) -> Any:
         if not isinstance(instance_name, str):
             raise TypeError(f'{_ref_keyword} should be str')
 
-        return RefValue(instance_name)
+        return RefValue(sys.intern(instance_name))
 
     expression_code = value.pop(_expr_keyword, _sentinel)
     if expression_code is not _sentinel:
@@ -180,12 +424,10 @@ def _load_param_value(value: Any) -> Any:
             raise TypeError(f'{_expr_keyword} should be str')
 
         try:
-            compile(expression_code, '<config>', 'eval')
+            return ExpressionValue(expression_code)
         except SyntaxError as e:
             raise ValueError(f'{_expr_keyword} is malformed', expression_code) from e
 
-        return ExpressionValue(expression_code)
-
     return DictValue({
         key: _load_param_value(val)
         for key, val in value.items()
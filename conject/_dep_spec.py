@@ -1,7 +1,8 @@
+import sys
 from contextlib import contextmanager, ExitStack
 from typing import (
     Dict, Any, Optional, TypeVar, AsyncContextManager, ContextManager, Generic, Tuple, Callable,
-    Sequence, List,
+    Sequence, List, Mapping, NamedTuple,
 )
 
 from async_exit_stack import AsyncExitStack
@@ -10,21 +11,32 @@ from async_generator import asynccontextmanager
 from conject._impl import Impl, FactoryType
 from conject._utils import prepare_async_impl, prepare_sync_impl, generate_name, probe_impl_factory
 from conject._container import Container, AsyncContainer
-from conject._container_config import load_container_config, ContainerConfig, check_container_config
-from conject._types import PreparedSyncImpl, PreparedAsyncImpl
+from conject._container_config import (
+    load_container_config, check_instance_impls, check_dependency_cycles, make_config_steps,
+    make_impl_steps,
+)
+from conject._plan import Plans, make_instance_ids
+from conject._types import PreparedSyncImpl, PreparedAsyncImpl, PlanStep
 
 TPreparedImpl = TypeVar('TPreparedImpl', PreparedSyncImpl, PreparedAsyncImpl)
 TContainer = TypeVar('TContainer', Container, AsyncContainer)
 TExitStack = TypeVar('TExitStack', ExitStack, AsyncExitStack)
 TFactory = TypeVar('TFactory')  # Factory or AsyncFactory
 
-_StartContainerParams = Tuple[Dict[str, TPreparedImpl], ContainerConfig]
+_StartContainerParams = Tuple[Mapping[str, int], Plans]
+
+
+class _ImplPlan(NamedTuple):
+    steps: Mapping[str, PlanStep]
+    instance_ids: Mapping[str, int]
+    plans: Plans  # used as is if there are no configured instances
 
 
 class _BaseDepSpec(Generic[TPreparedImpl, TContainer, TExitStack]):
     def __init__(self, impls: Sequence[Impl] = ()):
         self._impls: Dict[str, Impl] = {}
         self._prepared_impls: Dict[str, TPreparedImpl] = {}
+        self._impl_plan: Optional[_ImplPlan] = None
         self.add_many(impls)
 
     def add(
@@ -41,7 +53,7 @@ class _BaseDepSpec(Generic[TPreparedImpl, TContainer, TExitStack]):
 
         for impl in impls:
             try:
-                name = impl.name
+                name = sys.intern(impl.name)
                 if name in prepared_impls or name in self._impls:
                     raise ValueError(f'Multiple implementations named {name}')
 
@@ -51,8 +63,9 @@ class _BaseDepSpec(Generic[TPreparedImpl, TContainer, TExitStack]):
                 raise ValueError(f'Error adding {impl.name!r}') from e
 
         self._prepared_impls.update(prepared_impls)
+        self._impl_plan = None
         self._impls.update({
-            impl.name: impl for impl in impls
+            sys.intern(impl.name): impl for impl in impls
         })
 
     def decorate(
@@ -81,11 +94,36 @@ class _BaseDepSpec(Generic[TPreparedImpl, TContainer, TExitStack]):
     def _prepare_impl(self, impl: Impl) -> TPreparedImpl:
         raise NotImplementedError
 
-    def _before_start(self, config: Any) -> _StartContainerParams[TPreparedImpl]:
+    def _make_plans(self, steps: Mapping[str, PlanStep], instance_ids: Mapping[str, int]) -> Plans:
+        raise NotImplementedError
+
+    def _before_start(self, config: Any) -> _StartContainerParams:
         container_config = load_container_config(config)
-        check_container_config(container_config, self._prepared_impls)
-        # noinspection PyTypeChecker
-        return self._prepared_impls.copy(), container_config
+        check_instance_impls(container_config, self._prepared_impls)
+
+        impl_plan = self._get_impl_plan()
+        config_steps = make_config_steps(container_config, self._prepared_impls)
+        if not config_steps:
+            # Builders are compiled lazily, so containers share them along with the plan.
+            return impl_plan.instance_ids, impl_plan.plans
+
+        steps = {**impl_plan.steps, **config_steps}
+        # Cycles of not configured impls are reported by builders, once such instance is requested.
+        check_dependency_cycles(steps, config_steps)
+        instance_ids = make_instance_ids(config_steps, impl_plan.instance_ids)
+        return instance_ids, self._make_plans(steps, instance_ids)
+
+    def _get_impl_plan(self) -> _ImplPlan:
+        # Config-independent part of plan is shared by containers until impls are changed.
+        impl_plan = self._impl_plan
+        if impl_plan is None:
+            steps = make_impl_steps(self._prepared_impls)
+            instance_ids = make_instance_ids(steps)
+            impl_plan = self._impl_plan = _ImplPlan(
+                steps, instance_ids, self._make_plans(steps, instance_ids),
+            )
+
+        return impl_plan
 
 
 class DepSpec(_BaseDepSpec[PreparedSyncImpl, Container, ExitStack]):
@@ -95,18 +133,21 @@ class DepSpec(_BaseDepSpec[PreparedSyncImpl, Container, ExitStack]):
     @contextmanager
     def _start_container(self, config: Any):
         # noinspection PyTupleAssignmentBalance
-        impls, container_config = self._before_start(config)
+        instance_ids, plans = self._before_start(config)
 
         with ExitStack() as exit_stack:
-            yield Container(
-                impls=impls,
-                config=container_config,
+            yield Container._create(
                 exit_stack=exit_stack,
+                instance_ids=instance_ids,
+                plans=plans,
             )
 
     def _prepare_impl(self, impl: Impl) -> PreparedSyncImpl:
         return prepare_sync_impl(impl)
 
+    def _make_plans(self, steps: Mapping[str, PlanStep], instance_ids: Mapping[str, int]) -> Plans:
+        return Plans(steps, instance_ids, is_async=False)
+
 
 class AsyncDepSpec(_BaseDepSpec[PreparedAsyncImpl, AsyncContainer, AsyncExitStack]):
     def start_container(self, config: Any) -> AsyncContextManager[AsyncContainer]:
@@ -115,14 +156,17 @@ class AsyncDepSpec(_BaseDepSpec[PreparedAsyncImpl, AsyncContainer, AsyncExitStac
     @asynccontextmanager
     async def _start_container(self, config: Any):
         # noinspection PyTupleAssignmentBalance
-        impls, container_config = self._before_start(config)
+        instance_ids, plans = self._before_start(config)
 
         async with AsyncExitStack() as exit_stack:
-            yield AsyncContainer(
-                impls=impls,
-                config=container_config,
+            yield AsyncContainer._create(
                 exit_stack=exit_stack,
+                instance_ids=instance_ids,
+                plans=plans,
             )
 
     def _prepare_impl(self, impl: Impl) -> PreparedAsyncImpl:
         return prepare_async_impl(impl)
+
+    def _make_plans(self, steps: Mapping[str, PlanStep], instance_ids: Mapping[str, int]) -> Plans:
+        return Plans(steps, instance_ids, is_async=True)
@@ -0,0 +1,60 @@
+from typing import Any, Sequence, Type
+
+
+class InstanceError(Exception):
+    pass
+
+
+class MissingValue(InstanceError):
+    def __init__(self, instance_stack: Sequence[str]):
+        assert len(instance_stack)
+        self._instance_stack = instance_stack
+
+    def __str__(self) -> str:
+        if len(self._instance_stack) == 1:
+            instance, = self._instance_stack
+            return f'Neither instance nor impl exists {instance!r}'
+        else:
+            *rest, instance, param = self._instance_stack
+            build_chain = ' -> '.join(repr(item) for item in rest)
+            return (
+                f'Parameter {param!r} of instance {instance!r} is not configured '
+                f'(while building {build_chain} -> {instance!r})'
+            )
+
+
+class DependencyCycle(InstanceError):
+    def __init__(self, instances: Sequence[str]):
+        assert(len(instances))
+        self._instances = instances
+
+    def __str__(self) -> str:
+        build_chain = ' -> '.join(repr(item) for item in self._instances)
+        return f'Instance {self._instances[0]!r} is depending on itself: {build_chain}'
+
+
+class InvalidImplParam(InstanceError):
+    def __init__(self, inst_name: str, param_name: str, expected_type: Type, value: Any):
+        self.inst_name = inst_name
+        self.param_name = param_name
+        self.expected_type = expected_type
+        self.value = value
+
+    def __str__(self) -> str:
+        return (
+            f'Invalid param value for {self.inst_name}.{self.param_name}.'
+            f' Expected of type {self.expected_type}, got {self.value!r}'
+        )
+
+
+class InvalidInstanceType(InstanceError):
+    def __init__(self, inst_name: str, expected_type: Type, value: Any):
+        self.inst_name = inst_name
+        self.expected_type = expected_type
+        self.value = value
+
+    def __str__(self) -> str:
+        return (
+            f'Invalid {self.inst_name!r} type.'
+            f' Expected of type {self.expected_type}, got {self.value!r}'
+        )
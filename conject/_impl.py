@@ -34,6 +34,8 @@ class Impl:
     :param params: Bind default values for some factory params.
     """
 
+    __slots__ = ('_ftype', '_name', '_factory', '_params')
+
     def __init__(
             self, ftype: FactoryType, name: str, factory: Any,
             params: Optional[Mapping[str, Any]] = None,
@@ -0,0 +1,290 @@
+import functools
+from types import CodeType
+from typing import Any, Callable, Dict, List, Union, Optional, Tuple, Mapping
+
+from conject._errors import DependencyCycle, InvalidImplParam, MissingValue
+from conject._impl import FactoryType
+from conject._types import (
+    PreparedSyncImpl, PreparedAsyncImpl, PlanStep, ParamKind, ParamSite, missing,
+)
+from conject._validation import ValidationError
+from conject.utils import SkipTypeCheck
+
+Plan = Callable[..., Any]
+
+
+def make_instance_ids(
+        steps: Mapping[str, PlanStep], base_ids: Optional[Mapping[str, int]] = None,
+) -> Dict[str, int]:
+    """
+    Assign slot index to every instance that is mentioned by plan steps, extending `base_ids`.
+
+    Index 0 is reserved for 'container', then go plan steps, then instances
+    that can't be built (but can be injected).
+    """
+
+    instance_ids = {'container': 0} if base_ids is None else dict(base_ids)
+    for inst_name in steps:
+        instance_ids.setdefault(inst_name, len(instance_ids))
+    for step in steps.values():
+        for dep_name in step.deps:
+            instance_ids.setdefault(dep_name, len(instance_ids))
+
+    return instance_ids
+
+
+class Plans:
+    """
+    Specialized builder functions for plan steps, indexed by instance ids.
+
+    Every builder is called as `builder(container, stack)` and returns a freshly created instance.
+    `stack` is a linked list of instances being built, `(name, parent_stack)` or `None`.
+    Builders are generated on first request along with the builders of their dependencies,
+    so instances that are never requested cost nothing.
+    """
+
+    def __init__(
+            self, steps: Mapping[str, PlanStep], instance_ids: Mapping[str, int], is_async: bool,
+    ):
+        self._steps = steps
+        self._instance_ids = instance_ids
+        self._is_async = is_async
+        self._namespace: Dict[str, Any] = {
+            '_missing': missing,
+            '_check_param': _check_param,
+            '_validate_param': _validate_param,
+            '_missing_instance': _missing_instance,
+            '_dependency_cycle': _dependency_cycle,
+            '_unwrap': _unwrap,
+        }
+        self._plans: List[Optional[Plan]] = [None] * len(instance_ids)
+
+    def get_step(self, inst_name: str) -> Optional[PlanStep]:
+        return self._steps.get(inst_name)
+
+    def get(self, inst_name: str, inst_id: int) -> Optional[Plan]:
+        """Get builder of the instance, `None` if it can't be built."""
+
+        plan = self._plans[inst_id]
+        if plan is None:
+            step = self._steps.get(inst_name)
+            if step is not None:
+                self._compile(step)
+                plan = self._plans[inst_id]
+
+        return plan
+
+    def _compile(self, step: PlanStep) -> None:
+        # Collect the step with all its (transitive) dependencies, that are not compiled yet.
+        pending = [step]
+        seen = {step.name}
+        for pending_step in pending:
+            for dep_name in pending_step.deps:
+                dep_step = self._steps.get(dep_name)
+                if (
+                        dep_step is not None and dep_name not in seen
+                        and self._plans[self._instance_ids[dep_name]] is None
+                ):
+                    seen.add(dep_name)
+                    pending.append(dep_step)
+
+        sources = [
+            _BuilderSource(
+                self._steps, self._instance_ids, self._namespace, self._is_async,
+            ).generate(pending_step)
+            for pending_step in pending
+        ]
+        exec(_compile_source('\n'.join(sources)), self._namespace)
+
+        for pending_step in pending:
+            inst_id = self._instance_ids[pending_step.name]
+            self._plans[inst_id] = self._namespace[_builder_name(inst_id)]
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_source(source: str) -> CodeType:
+    # Sources only refer to values by names, so the same code runs in namespaces of
+    # different containers.
+    return compile(source, '<plan>', 'exec')
+
+
+def _builder_name(inst_id: int) -> str:
+    return f'_build_{inst_id}'
+
+
+# Kinds of params whose values could be SkipTypeCheck-wrapped at runtime.
+_wrapped_kinds = (ParamKind.Instance, ParamKind.Deferred)
+
+
+class _BuilderSource:
+    def __init__(
+            self, steps: Mapping[str, PlanStep], instance_ids: Mapping[str, int],
+            namespace: Dict[str, Any], is_async: bool,
+    ):
+        self._steps = steps
+        self._instance_ids = instance_ids
+        self._namespace = namespace
+        self._is_async = is_async
+        self._lines: List[str] = []
+        self._fetched: Dict[str, str] = {}
+
+    def generate(self, step: PlanStep) -> str:
+        func_name = _builder_name(self._instance_ids[step.name])
+        name_const = self._const(f'{func_name}_name', step.name)
+
+        call_args = []
+        for idx, site in enumerate(step.sites):
+            param = site.param
+            value_expr = self._param_value(f'{func_name}_{idx}', site)
+
+            if site.validate:
+                validator = self._const(f'{func_name}_{idx}_validator', param.validator)
+                # Only values fetched at runtime could skip the type check.
+                check = '_check_param' if site.kind in _wrapped_kinds else '_validate_param'
+                value_expr = f'{check}({value_expr}, {validator}, {name_const}, {param.name!r})'
+            elif site.kind in _wrapped_kinds:
+                value_expr = f'_unwrap({value_expr})'
+
+            self._emit(f'p_{idx} = {value_expr}')
+            # Params are passed by name: reported signature may differ from the actual one
+            # (e.g. `functools.wraps` or `__signature__` over `**kwargs`).
+            call_args.append(f'{param.name}=p_{idx}')
+
+        self._emit(f'instance = {self._create_instance(func_name, step.impl, call_args)}')
+
+        inst_id = self._instance_ids[step.name]
+        func_def = 'async def' if self._is_async else 'def'
+        if step.impl.ftype == FactoryType.Value:
+            body = ''.join(f'    {line}\n' for line in self._lines)
+            return (
+                f'{func_def} {func_name}(self, stack):\n'
+                f'    stack = ({name_const}, stack)\n'
+                f'    slots = self._slots\n'
+                f'{body}'
+                f'    slots[{inst_id}] = instance\n'
+                f'    return instance\n'
+            )
+
+        # Dependencies are acyclic, but factories may request instances from the container.
+        body = ''.join(f'        {line}\n' for line in self._lines)
+        return (
+            f'{func_def} {func_name}(self, stack):\n'
+            f'    building = self._building\n'
+            f'    if {inst_id} in building:\n'
+            f'        _dependency_cycle(stack, {name_const})\n'
+            f'    stack = ({name_const}, stack)\n'
+            f'    slots = self._slots\n'
+            f'    building.add({inst_id})\n'
+            f'    try:\n'
+            f'{body}'
+            f'    finally:\n'
+            f'        building.discard({inst_id})\n'
+            f'    slots[{inst_id}] = instance\n'
+            f'    return instance\n'
+        )
+
+    def _create_instance(
+            self, func_name: str, impl: Union[PreparedSyncImpl, PreparedAsyncImpl],
+            call_args: List[str],
+    ) -> str:
+
+        # Factories without finalization are called directly, bypassing the exit stack.
+        if impl.ftype == FactoryType.Value:
+            return self._const(f'{func_name}_value', impl.factory)
+
+        args = ', '.join(call_args)
+        if impl.ftype in (FactoryType.Class, FactoryType.Func):
+            return f'{self._const(f"{func_name}_factory", impl.factory)}({args})'
+
+        if impl.ftype == FactoryType.AFunc:
+            return f'await {self._const(f"{func_name}_factory", impl.factory)}({args})'
+
+        ctx_mgr_call = f'{self._const(f"{func_name}_ctx_mgr", impl.ctx_mgr)}({args})'
+        if self._is_async:
+            return f'await self._exit_stack.enter_async_context({ctx_mgr_call})'
+        else:
+            return f'self._exit_stack.enter_context({ctx_mgr_call})'
+
+    def _param_value(self, prefix: str, site: ParamSite) -> str:
+        kind = site.kind
+        if kind == ParamKind.Literal:
+            return self._const(f'{prefix}_value', site.payload)
+
+        if kind == ParamKind.Instance:
+            return self._fetch(site.payload)
+
+        if kind == ParamKind.Ref:
+            return f'_unwrap({self._fetch(site.payload)})'
+
+        assert kind == ParamKind.Deferred
+        deps = ', '.join(
+            f'{dep_name!r}: _unwrap({self._fetch(dep_name)})'
+            for dep_name in site.payload.deps
+        )
+        deferred = self._const(f'{prefix}_deferred', site.payload)
+        return f'{deferred}.eval({{{deps}}})'
+
+    def _fetch(self, inst_name: str) -> str:
+        var = self._fetched.get(inst_name)
+        if var is not None:
+            return var
+
+        var = self._fetched[inst_name] = f'v_{len(self._fetched)}'
+        inst_id = self._instance_ids[inst_name]
+        func_name = _builder_name(inst_id)
+        if inst_name not in self._steps:
+            build = f'_missing_instance(stack, {inst_name!r})'
+        elif self._is_async:
+            build = f'await {func_name}(self, stack)'
+        else:
+            build = f'{func_name}(self, stack)'
+
+        self._emit(f'{var} = slots[{inst_id}]')
+        self._emit(f'if {var} is _missing:')
+        self._emit(f'    {var} = {build}')
+        return var
+
+    def _const(self, name: str, value: Any) -> str:
+        self._namespace[name] = value
+        return name
+
+    def _emit(self, line: str) -> None:
+        self._lines.append(line)
+
+
+def _check_param(value: Any, validator: Callable, inst_name: str, param_name: str) -> Any:
+    if isinstance(value, SkipTypeCheck):
+        return value.value
+
+    return _validate_param(value, validator, inst_name, param_name)
+
+
+def _validate_param(value: Any, validator: Callable, inst_name: str, param_name: str) -> Any:
+    try:
+        return validator(value)
+    except ValidationError as e:
+        raise InvalidImplParam(inst_name, param_name, e.expected_type, e.value) from e
+
+
+def _unwrap(value: Any) -> Any:
+    if isinstance(value, SkipTypeCheck):
+        return value.value
+
+    return value
+
+
+def _missing_instance(stack: Optional[Tuple[str, Any]], inst_name: str) -> Any:
+    raise MissingValue(_instance_stack(stack, inst_name))
+
+
+def _dependency_cycle(stack: Optional[Tuple[str, Any]], inst_name: str) -> Any:
+    raise DependencyCycle(_instance_stack(stack, inst_name))
+
+
+def _instance_stack(stack: Optional[Tuple[str, Any]], inst_name: str) -> List[str]:
+    instance_stack = [inst_name]
+    while stack is not None:
+        name, stack = stack
+        instance_stack.append(name)
+
+    return instance_stack[::-1]
@@ -1,4 +1,9 @@
-from typing import Callable, NamedTuple, Mapping, Any, ContextManager, AsyncContextManager
+import enum
+from typing import (
+    Callable, NamedTuple, FrozenSet, Any, ContextManager, AsyncContextManager, Tuple, Union,
+)
+
+from conject._impl import FactoryType
 
 missing = object()
 
@@ -12,16 +17,55 @@ class Parameter(NamedTuple):
         return self.default is not missing
 
 
-FactoryParams = Mapping[str, Parameter]
+FactoryParams = Tuple[Parameter, ...]  # in the order of signature
 
 
 class PreparedSyncImpl(NamedTuple):
     name: str
     params: FactoryParams
+    param_names: FrozenSet[str]
     ctx_mgr: Callable[..., ContextManager]
+    ftype: FactoryType
+    factory: Any
 
 
 class PreparedAsyncImpl(NamedTuple):
     name: str
     params: FactoryParams
+    param_names: FrozenSet[str]
     ctx_mgr: Callable[..., AsyncContextManager]
+    ftype: FactoryType
+    factory: Any
+
+
+@enum.unique
+class ParamKind(enum.IntEnum):
+    """
+    Describes how param value is obtained.
+
+    `Literal` - configured (or default) value as is, payload is the value.
+    `Instance` - instance with the same name as param, payload is the name.
+    `Ref` - another instance, payload is its name.
+    `Deferred` - evaluation of `DeferredValue` (expression, dict, list), payload is the value.
+    """
+
+    Literal = enum.auto()
+    Instance = enum.auto()
+    Ref = enum.auto()
+    Deferred = enum.auto()
+
+
+class ParamSite(NamedTuple):
+    param: Parameter
+    kind: ParamKind
+    payload: Any
+    validate: bool  # false if param validator is trivial or value is known to skip type check
+
+
+class PlanStep(NamedTuple):
+    """Precomputed recipe of an instance construction."""
+
+    name: str
+    impl: Union[PreparedSyncImpl, PreparedAsyncImpl]
+    sites: Tuple[ParamSite, ...]  # one for every impl param
+    deps: Tuple[str, ...]  # names of instances to fetch, in the order of fetching
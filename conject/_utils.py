@@ -1,8 +1,13 @@
+import functools
 import inspect
+import sys
 import typing
-from functools import wraps
-from types import SimpleNamespace
-from typing import Callable, Any, ContextManager, Mapping
+import weakref
+from types import SimpleNamespace, FunctionType
+from typing import (
+    Callable, Any, ContextManager, AsyncContextManager, Dict, List, Mapping, MutableMapping,
+    Optional, NamedTuple, Sequence, Tuple, Type, TypeVar, Union,
+)
 
 from conject._ctx_mgr import async_context_manager, context_manager, sync_to_async_ctx_mgr
 from conject._impl import Impl, FactoryType
@@ -10,15 +15,6 @@ from conject._types import FactoryParams, Parameter, missing, PreparedAsyncImpl,
 from conject._validation import make_validator
 
 
-def run_coro_synchronously(coro):
-    try:
-        coro.send(None)
-    except StopIteration as e:
-        return e.value
-
-    raise RuntimeError('internal error - sync function yielded something')
-
-
 def generate_name(factory: Any) -> str:
     if not inspect.isfunction(factory) and not inspect.isclass(factory):
         raise ValueError('Unable to automatically generate impl name', factory)
@@ -27,6 +23,41 @@ def generate_name(factory: Any) -> str:
 
 
 def get_factory_params(impl: Impl) -> FactoryParams:
+    # Bound defaults are not used as a cache key: they may be unhashable, and equal values
+    # of different types (e.g. `1` and `True`) would get mixed up.
+    if impl.params or not _is_identity_hashable(impl.factory):
+        return _get_factory_params(impl.ftype, impl.name, impl.factory, impl.params)
+
+    # Params are cached only while the factory is alive, so short-living callables
+    # (and everything they capture) are not kept by the cache.
+    factory_cache = _factory_params_cache.get(impl.factory)
+    if factory_cache is None:
+        factory_cache = _factory_params_cache.setdefault(impl.factory, {})
+
+    cache_key = (impl.ftype, impl.name)
+    params = factory_cache.get(cache_key)
+    if params is None:
+        params = factory_cache[cache_key] = _get_factory_params(
+            impl.ftype, impl.name, impl.factory, None,
+        )
+
+    return params
+
+
+# Results are shared, so they should never be modified.
+_factory_params_cache: MutableMapping[Any, Dict[Tuple[FactoryType, str], FactoryParams]] = \
+    weakref.WeakKeyDictionary()
+
+
+_allowed_kinds = frozenset((
+    inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY,
+))
+
+
+def _get_factory_params(
+        ftype: FactoryType, impl_name: str, factory: Any,
+        bound_params: Optional[Mapping[str, Any]],
+) -> FactoryParams:
     # parameter kinds:
     #   POSITIONAL_ONLY
     #   POSITIONAL_OR_KEYWORD
@@ -34,119 +65,227 @@ def get_factory_params(impl: Impl) -> FactoryParams:
     #   KEYWORD_ONLY
     #   VAR_KEYWORD
 
-    if impl.ftype == FactoryType.Value:
-        return {}
-
-    if not callable(impl.factory):
-        raise ValueError(f'Factory should be callable: {impl.name}')
-
-    allowed_kinds = (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+    if ftype == FactoryType.Value:
+        return ()
 
-    signature = inspect.signature(impl.factory)
-    types = _get_type_hints(impl.factory, signature)
+    if not callable(factory):
+        raise ValueError(f'Factory should be callable: {impl_name}')
 
-    def parse_param(parameter: inspect.Parameter) -> Parameter:
-        name = parameter.name
+    parameters = _get_signature_params(factory)
+    types = _get_type_hints(factory, parameters)
+    bound_params = bound_params or {}
 
-        if parameter.kind not in allowed_kinds:
-            raise ValueError(f'Unsupported parameter kind {impl.name}.{name}')
+    factory_params: List[Parameter] = []
+    for parameter in parameters:
+        name = sys.intern(parameter.name)
+        if parameter.kind not in _allowed_kinds:
+            raise ValueError(f'Unsupported parameter kind {impl_name}.{name}')
 
         default = missing
-        if impl.params is not None and name in impl.params:
-            default = impl.params[name]
+        if name in bound_params:
+            default = bound_params[name]
         elif parameter.default is not inspect.Parameter.empty:
             default = parameter.default
 
-        validator = make_validator(types.get(name, Any), f'{impl.name}__{name}')
-
-        return Parameter(
-            parameter.name,
+        factory_params.append(Parameter(
+            name,
             default=default,
-            validator=validator,
-        )
+            validator=make_validator(types.get(name, Any), f'{impl_name}__{name}'),
+        ))
 
-    factory_params: FactoryParams = {
-        name: parse_param(parameter)
-        for name, parameter in signature.parameters.items()
-    }
+    return tuple(factory_params)
+
+
+class _SignatureParam(NamedTuple):
+    # Subset of `inspect.Parameter` interface
+    name: str
+    kind: Any
+    default: Any
+    annotation: Any
+
+
+_SignatureParams = Sequence[Union[inspect.Parameter, _SignatureParam]]
+
+
+def _get_signature_params(factory: Any) -> _SignatureParams:
+    # `inspect.signature` is slow, so plain functions are inspected directly.
+    if (
+            type(factory) is not FunctionType
+            or hasattr(factory, '__wrapped__')
+            or hasattr(factory, '__signature__')
+    ):
+        return tuple(inspect.signature(factory).parameters.values())
+
+    code = factory.__code__
+    if (
+            code.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS)
+            or getattr(code, 'co_posonlyargcount', 0)
+    ):
+        return tuple(inspect.signature(factory).parameters.values())
+
+    empty = inspect.Parameter.empty
+    annotations = factory.__annotations__
+    defaults = factory.__defaults__ or ()
+    kwdefaults = factory.__kwdefaults__ or {}
+
+    names = code.co_varnames[:code.co_argcount + code.co_kwonlyargcount]
+    first_default = code.co_argcount - len(defaults)
+
+    parameters = []
+    for idx, name in enumerate(names):
+        kind: Any
+        if idx < code.co_argcount:
+            kind = inspect.Parameter.POSITIONAL_OR_KEYWORD
+            default = defaults[idx - first_default] if idx >= first_default else empty
+        else:
+            kind = inspect.Parameter.KEYWORD_ONLY
+            default = kwdefaults.get(name, empty)
+
+        parameters.append(_SignatureParam(name, kind, default, annotations.get(name, empty)))
+
+    return parameters
+
+
+def get_callable_params(factory: Callable) -> FactoryParams:
+    """Get params of arbitrary callable, as if it was registered as `Func` impl."""
+
+    return get_factory_params(Impl(FactoryType.Func, 'factory', factory))
 
-    return factory_params
 
+def _get_type_hints(factory: Any, parameters: _SignatureParams) -> Mapping[str, Any]:
+    annotations = {
+        parameter.name: parameter.annotation
+        for parameter in parameters
+        if parameter.annotation is not inspect.Signature.empty
+    }
+    if all(_is_resolved_annotation(annotation) for annotation in annotations.values()):
+        return annotations
 
-def _get_type_hints(factory: Any, signature: inspect.Signature) -> Mapping[str, Any]:
     # Yeah, this is a bit hacky. It is necessary to support
     # funcs/classes/NameTuples/dataclasses/partials/etc.
 
-    annotated = SimpleNamespace(
-        __annotations__={
-            name: parameter.annotation
-            for name, parameter in signature.parameters.items()
-            if parameter.annotation is not inspect.Signature.empty
-        },
-    )
+    annotated = SimpleNamespace(__annotations__=annotations)
 
     return typing.get_type_hints(
         typing.cast(Any, annotated), globalns=getattr(factory, '__globals__', {}),
     )
 
 
+def _is_resolved_annotation(annotation: Any) -> bool:
+    # Plain classes are returned by `get_type_hints` as is. Generics may contain forward refs.
+    return (
+        annotation is Any
+        or (isinstance(annotation, type) and not getattr(annotation, '__args__', None))
+    )
+
+
 def make_sync_ctx_mgr(ftype: FactoryType, factory: Any) -> Callable[..., ContextManager]:
-    if ftype == FactoryType.CtxMgr:
-        return factory
+    if _is_identity_hashable(factory):
+        return _make_sync_ctx_mgr_cached(ftype, factory)
 
-    factory_gen: Callable
-    if ftype == FactoryType.Value:
-        def factory_gen():
-            yield factory
+    return _make_sync_ctx_mgr(ftype, factory)
+
+
+def make_async_ctx_mgr(ftype: FactoryType, factory: Any) -> Callable[..., AsyncContextManager]:
+    if _is_identity_hashable(factory):
+        return _make_async_ctx_mgr_cached(ftype, factory)
 
-    elif ftype in (FactoryType.Class, FactoryType.Func):
-        def factory_gen(*args, **kwargs):
-            yield factory(*args, **kwargs)
+    return _make_async_ctx_mgr(ftype, factory)
 
-    elif ftype == FactoryType.GenFunc:
-        factory_gen = factory
 
-    else:
+def _is_identity_hashable(factory: Any) -> bool:
+    # Params and context manager makers are cached only for factories
+    # that are never equal to other objects.
+    # Arbitrary values and callables may be unhashable or compare equal while being different.
+    return type(factory) is FunctionType or type(factory) is type
+
+
+def _make_sync_ctx_mgr(ftype: FactoryType, factory: Any) -> Callable[..., ContextManager]:
+    make_ctx_mgr = _sync_ctx_mgr_makers.get(ftype)
+    if make_ctx_mgr is None:
         raise ValueError(f'Unsupported factory type: {ftype}')
 
-    ctx_mgr = context_manager(factory_gen)
-    return ctx_mgr
+    return make_ctx_mgr(factory)
+
+
+def _make_async_ctx_mgr(ftype: FactoryType, factory: Any) -> Callable[..., AsyncContextManager]:
+    make_ctx_mgr = _async_ctx_mgr_makers.get(ftype)
+    if make_ctx_mgr is None:
+        return sync_to_async_ctx_mgr(make_sync_ctx_mgr(ftype, factory))
+
+    return make_ctx_mgr(factory)
+
+
+def _value_ctx_mgr(factory: Any) -> Callable[..., ContextManager]:
+    def factory_gen():
+        yield factory
+
+    return context_manager(factory_gen)
 
 
-def make_async_ctx_mgr(ftype: FactoryType, factory: Any):
-    if ftype == FactoryType.AGenFunc:
-        ctx_mgr = async_context_manager(factory)
+def _func_ctx_mgr(factory: Any) -> Callable[..., ContextManager]:
+    def factory_gen(*args, **kwargs):
+        yield factory(*args, **kwargs)
 
-    elif ftype == FactoryType.AFunc:
-        @wraps(factory)
-        async def gen_func(*args, **kwargs):
-            instance = await factory(*args, **kwargs)
-            yield instance
+    return context_manager(factory_gen)
 
-        ctx_mgr = async_context_manager(gen_func)
 
-    elif ftype == FactoryType.ACtxMgr:
-        ctx_mgr = factory
+def _async_func_ctx_mgr(factory: Any) -> Callable[..., AsyncContextManager]:
+    async def gen_func(*args, **kwargs):
+        instance = await factory(*args, **kwargs)
+        yield instance
 
-    else:
-        ctx_mgr = sync_to_async_ctx_mgr(make_sync_ctx_mgr(ftype, factory))
+    return async_context_manager(gen_func)
 
-    return ctx_mgr
+
+def _as_is(factory: Any) -> Any:
+    return factory
+
+
+_sync_ctx_mgr_makers: Dict[FactoryType, Callable[[Any], Callable[..., ContextManager]]] = {
+    FactoryType.Value: _value_ctx_mgr,
+    FactoryType.Class: _func_ctx_mgr,
+    FactoryType.Func: _func_ctx_mgr,
+    FactoryType.GenFunc: context_manager,
+    FactoryType.CtxMgr: _as_is,
+}
+
+_async_ctx_mgr_makers: Dict[FactoryType, Callable[[Any], Callable[..., AsyncContextManager]]] = {
+    FactoryType.AFunc: _async_func_ctx_mgr,
+    FactoryType.AGenFunc: async_context_manager,
+    FactoryType.ACtxMgr: _as_is,
+}
+
+_make_sync_ctx_mgr_cached = functools.lru_cache(maxsize=1024)(_make_sync_ctx_mgr)
+_make_async_ctx_mgr_cached = functools.lru_cache(maxsize=1024)(_make_async_ctx_mgr)
 
 
 def prepare_sync_impl(impl: Impl) -> PreparedSyncImpl:
-    return PreparedSyncImpl(
-        name=impl.name,
-        params=get_factory_params(impl),
-        ctx_mgr=make_sync_ctx_mgr(impl.ftype, impl.factory),
-    )
+    return _prepare_impl(PreparedSyncImpl, impl, make_sync_ctx_mgr)
 
 
 def prepare_async_impl(impl: Impl) -> PreparedAsyncImpl:
-    return PreparedAsyncImpl(
-        name=impl.name,
-        params=get_factory_params(impl),
-        ctx_mgr=make_async_ctx_mgr(impl.ftype, impl.factory),
+    return _prepare_impl(PreparedAsyncImpl, impl, make_async_ctx_mgr)
+
+
+TPreparedImpl = TypeVar('TPreparedImpl', PreparedSyncImpl, PreparedAsyncImpl)
+
+
+def _prepare_impl(
+        prepared_cls: Type[TPreparedImpl], impl: Impl,
+        make_ctx_mgr: Callable[[FactoryType, Any], Any],
+) -> TPreparedImpl:
+
+    ftype = impl.ftype
+    factory = impl.factory
+    params = get_factory_params(impl)
+    return prepared_cls(
+        name=sys.intern(impl.name),
+        params=params,
+        param_names=frozenset(param.name for param in params),
+        ctx_mgr=make_ctx_mgr(ftype, factory),
+        ftype=ftype,
+        factory=factory,
     )
 
 
@@ -156,7 +295,16 @@ def probe_impl_factory(impl: Impl) -> None:
     ftype = impl.ftype
     factory = impl.factory
 
-    if inspect.iscoroutinefunction(factory) and ftype == FactoryType.Func:
+    if ftype == FactoryType.Func and _is_coroutine_function(factory):
         raise ValueError(
             f'Factory {impl.name!r} is an async function, but factory type set to {ftype}'
         )
+
+
+def _is_coroutine_function(factory: Any) -> bool:
+    # Attributes of a function may mark it as coroutine function (`inspect.markcoroutinefunction`),
+    # so only plain functions without them are checked by code flags.
+    if type(factory) is FunctionType and not factory.__dict__:
+        return bool(factory.__code__.co_flags & inspect.CO_COROUTINE)
+
+    return inspect.iscoroutinefunction(factory)
@@ -1,6 +1,5 @@
-from typing import Any, Type
-
-import pydantic
+import functools
+from typing import Any, Type, Callable
 
 
 class ValidationError(Exception):
@@ -13,26 +12,96 @@ def make_validator(val_type: Any, debug_name: str) -> Any:
     if val_type is Any:
         return _empty_validator
 
-    class Config(pydantic.BaseConfig):
-        arbitrary_types_allowed = True
+    # Validators are shared between all params of the same type, so `debug_name` is only used
+    # for types that can't be cached. Type repr is a part of the key, since some types are equal
+    # regardless of their args order (e.g. `Union`), but pydantic isn't.
+    try:
+        return _make_type_validator_cached(val_type, repr(val_type))
+    except TypeError:
+        # unhashable type
+        return _make_type_validator(val_type, debug_name)
 
-    model = pydantic.create_model(
-        debug_name,
-        __config__=Config,
-        value=(val_type, ...),
-    )
 
-    def validate(value: Any) -> Any:
+def _make_type_validator(val_type: Any, model_name: str = 'Validator') -> Callable[[Any], Any]:
+    # pydantic is heavy to import, so it is only imported once some param type is to be checked.
+    import pydantic
+
+    validate_value = _make_pydantic_validator(val_type, model_name)
+
+    def validate_model(value: Any) -> Any:
         try:
-            result = model(value=value)
+            return validate_value(value)
         except pydantic.ValidationError as e:
             raise ValidationError(value, val_type) from e
 
+    if val_type not in _plain_types:
+        validate_model.val_type = val_type  # type: ignore
+        return validate_model
+
+    # Values of exactly these types need no coercion, so pydantic is only needed for the rest.
+    def validate(value: Any) -> Any:
+        if type(value) is val_type:
+            return value
+
+        return validate_model(value)
+
+    validate.val_type = val_type  # type: ignore
+    return validate
+
+
+_plain_types = (int, float, str, bytes, bool, list, dict, tuple)
+
+
+@functools.lru_cache(maxsize=1024)
+def _make_type_validator_cached(val_type: Any, type_repr: str) -> Callable[[Any], Any]:
+    return _make_type_validator(val_type)
+
+
+def _make_pydantic_validator(val_type: Any, model_name: str) -> Callable[[Any], Any]:
+    import pydantic
+
+    config: Any
+    if hasattr(pydantic, 'TypeAdapter'):
+        # pydantic v2
+        try:
+            adapter = pydantic.TypeAdapter(val_type, config=_v2_config)
+        except pydantic.PydanticUserError:  # type: ignore
+            # models, dataclasses, etc. don't accept config, but model fields still use it
+            config = _v2_config
+        else:
+            return adapter.validate_python
+    else:
+        config = _get_v1_config()
+
+    model = pydantic.create_model(
+        model_name,
+        __config__=config,
+        value=(val_type, ...),
+    )
+
+    def validate(value: Any) -> Any:
         # noinspection PyUnresolvedReferences
-        return result.value  # type: ignore
+        return model(value=value).value  # type: ignore
 
     return validate
 
 
+_v2_config = {'arbitrary_types_allowed': True}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_v1_config() -> type:
+    import pydantic
+
+    class Config(pydantic.BaseConfig):
+        arbitrary_types_allowed = True
+
+    return Config
+
+
+def is_empty_validator(validator: Any) -> bool:
+    return validator is _empty_validator
+
+
 def _empty_validator(value: Any) -> Any:
     return value
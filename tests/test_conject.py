@@ -1,8 +1,21 @@
-from typing import Any
+import dataclasses
+import functools
+import gc
+import inspect
+import subprocess
+import sys
+import unittest
+import weakref
+from contextlib import ExitStack
+from typing import Any, Union
 
 import asynctest
+import pydantic
 
-from conject import AsyncDepSpec, DepSpec, Impl, InvalidImplParam, InvalidInstanceType
+from conject import (
+    AsyncDepSpec, DepSpec, Impl, InvalidImplParam, InvalidInstanceType, DependencyCycle,
+    MissingValue, Container, load_container_config,
+)
 from conject.utils import SkipTypeCheck
 
 
@@ -124,6 +137,71 @@ class ConjectTestCase(asynctest.TestCase):
             with self.assertRaises(InvalidInstanceType):
                 container.get('sum_inst_2', dict)
 
+    def test_union_args_order(self):
+        spec = DepSpec()
+
+        # These validators are created first, but shouldn't be reused for differently ordered
+        # unions.
+        @spec.decorate(spec.Func)
+        def int_or_float(value: Union[int, float]):
+            return value
+
+        @spec.decorate(spec.Func)
+        def int_or_str(value: Union[int, str]):
+            return value
+
+        @spec.decorate(spec.Func)
+        def float_or_int(value: Union[float, int]):
+            return value
+
+        @spec.decorate(spec.Func)
+        def str_or_int(value: Union[str, int]):
+            return value
+
+        config = {
+            'float_or_int': {'value': 1.5},
+            'str_or_int': {'value': '1'},
+        }
+        with spec.start_container(config) as container:
+            self.assertEqual(container.get('float_or_int'), 1.5)
+            self.assertEqual(container.get('str_or_int'), '1')
+
+    @unittest.skipUnless(hasattr(pydantic, 'TypeAdapter'), 'pydantic v2 only')
+    def test_dataclass_with_arbitrary_type(self):
+        class Arbitrary:
+            pass
+
+        @dataclasses.dataclass
+        class Wrapper:
+            value: Arbitrary
+
+        spec = DepSpec()
+
+        @spec.decorate(spec.Func)
+        def unwrap(wrapper: Wrapper):
+            return wrapper.value
+
+        value = Arbitrary()
+        with spec.start_container({'unwrap': {'wrapper': Wrapper(value)}}) as container:
+            self.assertIs(container.get('unwrap'), value)
+
+        with spec.start_container({'unwrap': {'wrapper': 'not a wrapper'}}) as container:
+            with self.assertRaises(InvalidImplParam):
+                container.get('unwrap')
+
+    @unittest.skipUnless(hasattr(inspect, 'markcoroutinefunction'), 'python 3.12+ only')
+    def test_marked_coroutine_function(self):
+        spec = DepSpec()
+
+        async def async_factory():
+            return 1
+
+        def marked():
+            return async_factory()
+
+        with self.assertRaises(ValueError):
+            spec.add(spec.Func, 'marked', inspect.markcoroutinefunction(marked))
+
     def test_skip_type_check(self):
         config = {
             'sum_inst': {
@@ -136,6 +214,259 @@ class ConjectTestCase(asynctest.TestCase):
             container.ensure_constructible('sum_inst')
             self.assertEqual(container.get('sum_inst'), 'onetwo')
 
+    def test_dependency_cycle(self):
+        spec = self._make_spec()
+
+        @spec.decorate(spec.Func)
+        def first(second_inst):
+            return 1
+
+        config = {
+            'second_inst': {'-impl': 'return_sum', 'first': {'-ref': 'first'}},
+        }
+
+        with self.assertRaises(DependencyCycle):
+            with spec.start_container(config):
+                pass
+
+    def test_runtime_dependency_cycle(self):
+        spec = self._make_spec()
+
+        @spec.decorate(spec.Func)
+        def greedy(container):
+            return container.get('greedy')
+
+        @spec.decorate(spec.Func)
+        def left(right):
+            return 'left'
+
+        @spec.decorate(spec.Func)
+        def right(left):
+            return 'right'
+
+        with spec.start_container({}) as container:
+            with self.assertRaises(DependencyCycle):
+                container.get('greedy')
+            with self.assertRaises(DependencyCycle):
+                container.get('left')
+
+            container.inject({'right': 'injected'})
+            self.assertEqual(container.get('left'), 'left')
+
+    async def test_runtime_dependency_cycle_async(self):
+        spec = self._make_spec(AsyncDepSpec)
+
+        @spec.decorate(spec.AFunc)
+        async def greedy(container):
+            return await container.get('greedy')
+
+        async with spec.start_container({}) as container:
+            with self.assertRaises(DependencyCycle):
+                await container.get('greedy')
+
+    def test_expression_with_reserved_ref_names(self):
+        config = load_container_config({
+            'sum_inst': {'-impl': 'return_sum', 'first': {'-expr': 'refs.__slots__ + 1'}},
+        })
+        deferred = config.instances['sum_inst'].parameters['first']
+        self.assertEqual(deferred.deps, {'__slots__'})
+        self.assertEqual(deferred.eval({'__slots__': 1}), 2)
+
+    def test_non_str_config_keys(self):
+        spec = self._make_spec()
+
+        with self.assertRaises(ValueError):
+            with spec.start_container({1: {'-impl': 'no_such_impl'}}):
+                pass
+
+        with self.assertRaises(ValueError):
+            with spec.start_container({'sum_inst': {'-impl': 'return_sum', 2: 3}}):
+                pass
+
+    def test_get_params_releases_factory(self):
+        class Captured:
+            pass
+
+        captured = Captured()
+        captured_ref = weakref.ref(captured)
+        with self._make_spec().start_container({}) as container:
+            params = container.get_params(lambda return_7, _captured=captured: None)
+            self.assertEqual(params, {'return_7': 7, '_captured': captured})
+
+        del captured, params
+        gc.collect()
+        self.assertIsNone(captured_ref())
+
+    def test_container_constructor(self):
+        spec = self._make_spec()
+        config = load_container_config({'sum_inst': {'-impl': 'return_sum', 'first': 1}})
+
+        with ExitStack() as exit_stack:
+            container = Container(spec._prepared_impls, config, exit_stack)
+            self.assertEqual(container.get('sum_inst'), 11)
+            self.assertEqual(container.get('return_7'), 7)
+
+        config = load_container_config({'sum_inst': {'-impl': 'no_such_impl'}})
+        with self.assertRaises(ValueError):
+            Container(spec._prepared_impls, config, ExitStack())
+
+    def test_failed_build_is_retried(self):
+        spec = self._make_spec()
+        attempts = []
+
+        @spec.decorate(spec.Func)
+        def flaky():
+            attempts.append(None)
+            if len(attempts) == 1:
+                raise RuntimeError('first attempt')
+            return len(attempts)
+
+        with spec.start_container({}) as container:
+            with self.assertRaises(RuntimeError):
+                container.get('flaky')
+
+            self.assertEqual(container.get('flaky'), 2)
+            self.assertEqual(container.get('flaky'), 2)
+
+    def test_keyword_only_params(self):
+        spec = DepSpec()
+
+        @spec.decorate(spec.Func)
+        def params(first: int, second: int = 2, *, third: int, fourth: int = 4):
+            return first, second, third, fourth
+
+        config = {'params': {'first': 1, 'third': 3}}
+        with spec.start_container(config) as container:
+            self.assertEqual(container.get('params'), (1, 2, 3, 4))
+
+    def test_dict_and_list_params(self):
+        spec = self._make_spec()
+
+        @spec.decorate(spec.Func)
+        def collect(mapping: dict, items: list):
+            return mapping, items
+
+        config = {
+            'first_collect': {
+                '-impl': 'collect',
+                'mapping': {'ref': {'-ref': 'return_7'}, 'const': 1, 'expr': {'-expr': '2'}},
+                'items': [1, {'-ref': 'return_7'}, {'-expr': 'refs.return_7 + 1'}],
+            },
+        }
+        config['second_collect'] = config['first_collect']
+        with spec.start_container(config) as container:
+            mapping, items = container.get('first_collect')
+            self.assertEqual(list(mapping.items()), [('ref', 7), ('const', 1), ('expr', 2)])
+            self.assertEqual(items, [1, 7, 8])
+
+            # evaluated values are not shared
+            other_mapping, other_items = container.get('second_collect')
+            self.assertEqual(other_mapping, mapping)
+            self.assertIsNot(other_mapping, mapping)
+            self.assertIsNot(other_items, items)
+
+    def test_missing_value(self):
+        spec = self._make_spec()
+
+        @spec.decorate(spec.Func)
+        def outer(sum_inst):
+            return sum_inst
+
+        config = {'sum_inst': {'-impl': 'return_sum'}}
+        with spec.start_container(config) as container:
+            with self.assertRaises(MissingValue) as cm:
+                container.get('outer')
+            self.assertEqual(
+                str(cm.exception),
+                "Parameter 'first' of instance 'sum_inst' is not configured "
+                "(while building 'outer' -> 'sum_inst')",
+            )
+
+            with self.assertRaises(MissingValue) as cm:
+                container.get('unknown')
+            self.assertEqual(str(cm.exception), "Neither instance nor impl exists 'unknown'")
+
+    def test_inject(self):
+        config = {'sum_inst': {'-impl': 'return_sum'}}
+        with self._make_spec().start_container(config) as container:
+            # `first` is only known as a dependency, `extra` is not known at all
+            container.inject({'first': 1, 'extra': 'value'})
+            self.assertEqual(container.get('sum_inst'), 11)
+            self.assertEqual(container.get('extra'), 'value')
+
+            # instance that could be built
+            container.inject({'return_7': 8})
+            self.assertEqual(container.get('return_7'), 8)
+
+            with self.assertRaises(ValueError):
+                container.inject({'sum_inst': 0})
+            with self.assertRaises(ValueError):
+                container.inject({'new': 1, 'extra': 'other'})
+            with self.assertRaises(MissingValue):
+                container.get('new')
+
+    def test_injected_skip_type_check(self):
+        config = {
+            'sum_inst': {'-impl': 'return_sum', 'second': {'-ref': 'second_inst'}},
+        }
+        with self._make_spec().start_container(config) as container:
+            container.inject({
+                'first': SkipTypeCheck('one'),
+                'second_inst': SkipTypeCheck('two'),
+            })
+            self.assertEqual(container.get('first', int), 'one')
+            self.assertEqual(container.get('second_inst', int), 'two')
+
+            # refs are unwrapped, but still checked against the param type
+            with self.assertRaises(InvalidImplParam):
+                container.get('sum_inst')
+
+        config = {'sum_inst': {'-impl': 'return_sum', 'second': {'-ref': 'second_inst'}}}
+        with self._make_spec().start_container(config) as container:
+            container.inject({'first': SkipTypeCheck(1.5), 'second_inst': SkipTypeCheck(2)})
+            self.assertEqual(container.get('sum_inst'), 3.5)
+
+    def test_pydantic_is_imported_lazily(self):
+        code = 'import sys, conject; print(\'pydantic\' in sys.modules)'
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'False')
+
+    def test_wrapped_factory(self):
+        spec = DepSpec()
+
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(**kwargs):
+                return func(**kwargs)
+
+            return wrapper
+
+        @spec.decorate(spec.Func)
+        @decorate
+        def subtract(first: int, second: int):
+            return first - second
+
+        config = {'subtract': {'first': 3, 'second': 1}}
+        with spec.start_container(config) as container:
+            self.assertEqual(container.get('subtract'), 2)
+
+    def test_factory_custom_signature(self):
+        spec = DepSpec()
+
+        @spec.decorate(spec.Class, 'described')
+        class Described:
+            __signature__ = inspect.Signature([
+                inspect.Parameter('first', inspect.Parameter.POSITIONAL_OR_KEYWORD),
+                inspect.Parameter('second', inspect.Parameter.POSITIONAL_OR_KEYWORD),
+            ])
+
+            def __init__(self, **kwargs):
+                self.kwargs = kwargs
+
+        config = {'described': {'first': 1, 'second': 2}}
+        with spec.start_container(config) as container:
+            self.assertEqual(container.get('described').kwargs, {'first': 1, 'second': 2})
+
     def test_sync_factories(self):
         call_log = []
 